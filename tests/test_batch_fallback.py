@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+pytest.importorskip("ollama")
+
+from translation_master import TranslationMaster
+
+
+class FailingBatchClient:
+    """
+    Refuses batched prompts and echoes single-file prompts in upper case.
+    """
+
+    def chat(self, model, messages, stream=False, **kwargs):
+        content = messages[-1]["content"]
+        if "<<<FILE" in content:
+            raise ConnectionError("refused")
+        return iter([{"message": {"content": content.upper()}}])
+
+
+@pytest.mark.parametrize("mode", ["batched", "concatenated"])
+def test_failed_batch_request_translates_files_separately(tmp_path, mode):
+    input_dir = tmp_path / "input"
+    (input_dir / "sub").mkdir(parents=True)
+    (input_dir / "a.txt").write_text("hello\n")
+    (input_dir / "b.txt").write_text("world\n")
+    (input_dir / "sub" / "c.txt").write_text("again\n")
+
+    master = TranslationMaster(model_name="test", logging_path=str(tmp_path / "logs"), use_cache=False, mode=mode)
+    master._client = FailingBatchClient()
+    master.start_translating(str(input_dir), str(tmp_path / "output"), "fr")
+
+    run_dir = tmp_path / "output" / "run_fr_1"
+    assert (run_dir / "a_fr.txt").read_text() == "HELLO"
+    assert (run_dir / "b_fr.txt").read_text() == "WORLD"
+    assert (run_dir / "sub" / "c_fr.txt").read_text() == "AGAIN"
+    assert len([f for _, _, files in os.walk(run_dir) for f in files]) == 3
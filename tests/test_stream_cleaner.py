@@ -0,0 +1,36 @@
+import random
+
+import pytest
+
+pytest.importorskip("ollama")
+
+from translation_master import TranslationMaster, clean_stream
+
+PIECES = ["<think>", "</think>", "<b>", "</b>", "<", ">", "a", "x y", "`", "```", "\n", " ", "<thi", "nk>", "</thi"]
+
+
+def clean_response(text: str) -> str:
+    return TranslationMaster.__new__(TranslationMaster).clean_response(text)
+
+
+def chunked(text: str, size: int) -> list:
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def test_unclosed_think_keeps_following_text():
+    text = "Use the <think> tag to mark reasoning.\nMore text"
+    assert "".join(clean_stream(chunked(text, 3))) == clean_response(text) == "Use the  tag to mark reasoning.\nMore text"
+
+
+def test_closed_think_and_fence_are_removed():
+    text = "```<think>plan\n</think>\n  Hello <b>world</b>  \n"
+    assert "".join(clean_stream(chunked(text, 2))) == "Hello world"
+
+
+def test_stream_matches_clean_response_for_any_chunking():
+    rng = random.Random(0)
+    for _ in range(20000):
+        text = "".join(rng.choice(PIECES) for _ in range(rng.randint(0, 14)))
+        expected = clean_response(text)
+        for size in (1, 2, 3, 7, len(text) or 1):
+            assert "".join(clean_stream(chunked(text, size))) == expected, (text, size)
@@ -1,45 +1,279 @@
 import os
 import json
+import atexit
 import logging
+import logging.handlers
+import queue
 import datetime
 import re
 import argparse
+import functools
+import hashlib
+import sqlite3
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from pathlib import Path
 import ollama
 from ollama._types import ListResponse
 
+# Ways files are grouped into model requests, see TranslationMaster.start_translating.
+TRANSLATION_MODES = ("per_file", "batched", "concatenated")
+
+# Matches one file block in the response to a batched prompt.
+BATCH_BLOCK_PATTERN = re.compile(r"<<<FILE (\d+):[^>]+>>>\n(.*?)\n<<<END \1>>>", re.DOTALL)
+# Matches reasoning blocks emitted by thinking models.
+THINK_PATTERN = re.compile(r"<think>.*?</think>", re.DOTALL)
+# Matches everything clean_response removes, in a single pass: reasoning blocks, tags and a leading code fence.
+CLEANUP_PATTERN = re.compile(r"<think>.*?</think>|<[^>]*>|\A```", re.DOTALL)
+# Matches an ISO language code in a file name, e.g. "_en" in "messages_en".
+LANGUAGE_CODE_PATTERN = re.compile(r"_[a-zA-Z]{2,3}(?=(_|$))")
+
+# System prompts are sent ahead of the file content and only depend on the target language,
+# so they form an identical prefix for every request that ollama can reuse.
+SYSTEM_PROMPT = """
+You are a professional translation AI with expertise in technical texts and code files.
+Translate the content of the user message into {target_language}, preserving its exact formatting (line breaks, indentation, and spacing).
+Important:
+- Translate only user-facing strings, labels, messages, and display text.
+- Translate file path or import statements only if they include a language code error.
+- Ensure the translated output remains a valid code file.
+- Do not include additional commentary or explanations.
+"""
+BATCH_SYSTEM_PROMPT = """
+You are a professional translation AI with expertise in technical texts and code files.
+The user message contains several files, each starting with a <<<FILE i: path>>> line and ending with a <<<END i>>> line.
+Translate each file into {target_language}, preserving its exact formatting (line breaks, indentation, and spacing).
+Important:
+- Return every file wrapped in the same <<<FILE i: path>>> and <<<END i>>> lines, in the same order.
+- Translate only user-facing strings, labels, messages, and display text.
+- Translate file path or import statements only if they include a language code error.
+- Ensure each translated file remains a valid code file.
+- Do not include additional commentary or explanations.
+"""
+
+
+class StreamCleaner:
+    """
+    Incrementally removes <think>...</think> blocks, <...> tags and a leading ``` fence from a streamed
+    model response, and strips surrounding whitespace. The result matches clean_response on the full text.
+    Each chunk is scanned once; an unclosed "<" region, an unclosed <think> block and trailing whitespace
+    are held back between chunks.
+    """
+
+    TEXT, IN_TAG, IN_THINK = range(3)
+
+    def __init__(self):
+        self._state = self.TEXT
+        self._buffer = ""
+        self._head = ""
+        self._fence_checked = False
+        self._started = False
+        self._trailing = ""
+
+    def feed(self, chunk: str) -> str:
+        """
+        Consumes a chunk of the response and returns the cleaned text that is safe to emit.
+        """
+        if not self._fence_checked:
+            # Hold the start of the response until it is clear whether it opens with a code fence.
+            self._head += chunk
+            if len(self._head) < 3:
+                return ""
+            chunk = self._strip_fence()
+        return self._emit(self._scan(chunk))
+
+    def flush(self) -> str:
+        """
+        Returns any remaining cleaned text once the response is complete.
+        An unclosed "<" is kept as text. An unclosed <think> is removed like any other tag and its content is kept.
+        """
+        parts = [self._scan(self._strip_fence())] if not self._fence_checked else []
+        while self._state != self.TEXT:
+            held = self._buffer
+            self._buffer = ""
+            if self._state == self.IN_TAG:
+                self._state = self.TEXT
+                parts.append(held)
+            else:
+                self._state = self.TEXT
+                parts.append(self._scan(held))
+        text = self._emit("".join(parts))
+        self._trailing = ""
+        return text
+
+    def _strip_fence(self) -> str:
+        text = self._head[3:] if self._head.startswith("```") else self._head
+        self._head = ""
+        self._fence_checked = True
+        return text
+
+    def _scan(self, chunk: str) -> str:
+        # Text held back from earlier chunks is known not to contain the terminator it waits for,
+        # so it is not scanned again.
+        scanned = len(self._buffer)
+        text = self._buffer + chunk
+        self._buffer = ""
+        parts = []
+        pos = 0
+        while pos < len(text):
+            if self._state == self.TEXT:
+                start = text.find("<", pos)
+                if start < 0:
+                    parts.append(text[pos:])
+                    break
+                parts.append(text[pos:start])
+                pos = start
+                self._state = self.IN_TAG
+            elif self._state == self.IN_TAG:
+                end = text.find(">", max(pos, scanned))
+                if end < 0:
+                    self._buffer = text[pos:]
+                    break
+                is_think = end - pos == len("<think>") - 1 and text.startswith("<think>", pos)
+                self._state = self.IN_THINK if is_think else self.TEXT
+                pos = end + 1
+            else:
+                # A closing tag may be split across chunks, so rescan the end of the held text.
+                end = text.find("</think>", max(pos, scanned - len("</think>") + 1))
+                if end < 0:
+                    self._buffer = text[pos:]
+                    break
+                self._state = self.TEXT
+                pos = end + len("</think>")
+        return "".join(parts)
+
+    def _emit(self, text: str) -> str:
+        if not self._started:
+            text = text.lstrip()
+            if not text:
+                return ""
+            self._started = True
+        text = self._trailing + text
+        stripped = text.rstrip()
+        self._trailing = text[len(stripped):]
+        return stripped
+
+
+def clean_stream(chunks):
+    """
+    Yields the cleaned text of a streamed model response, see StreamCleaner.
+    """
+    cleaner = StreamCleaner()
+    for chunk in chunks:
+        text = cleaner.feed(chunk)
+        if text:
+            yield text
+    text = cleaner.flush()
+    if text:
+        yield text
+
 
 class TranslationMaster:
-    def __init__(self, model_name: str = "deepseek-r1:8b", logging_path: str = None):
+    def __init__(self, model_name: str = "deepseek-r1:8b", logging_path: str = None, max_concurrency: int = 1,
+                 use_cache: bool = True, mode: str = "per_file", batch_files: int = 16, batch_char_budget: int = 8000,
+                 translate_extensions: list = None, keep_alive: str = "30m", fast_model: str = None,
+                 fast_model_threshold_chars: int = 500):
         """
         Initialize the TranslationMaster with a specific model and logging path.
+        max_concurrency controls how many files are translated in parallel.
+        use_cache enables the persistent translation cache stored next to the logging directory.
+        mode is one of TRANSLATION_MODES: "per_file" sends every file on its own, "batched" groups small files
+        into prompts of at most batch_files files and batch_char_budget characters, and "concatenated" sends
+        all files in a single prompt. Batched and concatenated modes still write one output file per input file.
+        translate_extensions optionally restricts translation to files with one of the given extensions.
+        keep_alive is how long ollama keeps the model loaded between requests, e.g. "30m".
+        When fast_model is set, content shorter than fast_model_threshold_chars is translated with it instead.
         """
         self.model_name = model_name
+        self.fast_model = fast_model
+        self.fast_model_threshold_chars = fast_model_threshold_chars
+        self.keep_alive = keep_alive
+        # A single client keeps its HTTP connections alive and is shared by all worker threads.
+        self._client = ollama.Client()
+        self.max_concurrency = max(1, max_concurrency)
+        if mode not in TRANSLATION_MODES:
+            raise ValueError(f"Unknown translation mode '{mode}', expected one of {', '.join(TRANSLATION_MODES)}")
+        self.mode = mode
+        self.batch_files = max(1, batch_files)
+        self.batch_char_budget = batch_char_budget
+        self.translate_extensions = {
+            ext.lower() if ext.startswith(".") else f".{ext.lower()}" for ext in translate_extensions
+        } if translate_extensions else None
+        # Serializes output file name resolution between worker threads.
+        self._save_lock = threading.Lock()
+        # File names known to exist per output directory, filled on first use.
+        self._output_names = {}
+        # Saved outputs of the current run by content digest, so identical files are only translated once.
+        self._translations = {}
+        self._translations_lock = threading.Lock()
         # Use provided logging directory or default to the current working directory.
         self.logging_path = logging_path if logging_path else os.getcwd()
         Path(self.logging_path).mkdir(parents=True, exist_ok=True)
         self.setup_logging()
+        self._cache = self.setup_cache() if use_cache else None
+
+    def setup_cache(self) -> sqlite3.Connection:
+        """
+        Opens (or creates) the translation cache database in a "cache" directory next to the logging directory.
+        Cached translations are keyed on model, target language and file content.
+        """
+        cache_dir = os.path.join(os.path.dirname(os.path.abspath(self.logging_path)), "cache")
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+        # The connection is shared between worker threads, access goes through _cache_lock.
+        self._cache_lock = threading.Lock()
+        connection = sqlite3.connect(os.path.join(cache_dir, "translations.db"), check_same_thread=False)
+        connection.execute("CREATE TABLE IF NOT EXISTS translations (key TEXT PRIMARY KEY, translation TEXT NOT NULL)")
+        connection.commit()
+        return connection
+
+    def get_cached_translation(self, key: str):
+        """
+        Returns the cached translation for the given key, or None if it is not cached.
+        """
+        if self._cache is None:
+            return None
+        with self._cache_lock:
+            row = self._cache.execute("SELECT translation FROM translations WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def cache_translation(self, key: str, translation: str):
+        """
+        Stores a translation in the cache.
+        Empty translations, e.g. a response with nothing after its <think> block, are not cached so a rerun retries them.
+        """
+        if self._cache is None or not translation:
+            return
+        with self._cache_lock:
+            self._cache.execute("INSERT OR REPLACE INTO translations (key, translation) VALUES (?, ?)", (key, translation))
+            self._cache.commit()
 
     def setup_logging(self):
         """
         Sets up logging to both file and console.
-        Log file names include the current date and a counter if multiple runs occur on the same day.
+        Records are handed to a queue and written by a single listener thread, so worker threads never wait on file I/O.
+        Log file names include the current date and time down to the microsecond,
+        so runs never share a log file and the logging directory does not have to be scanned.
         """
-        date_str = datetime.datetime.now().strftime("%Y-%m-%d")
-        log_files = [f for f in os.listdir(self.logging_path)
-                     if f.endswith(".log") and date_str in f]
-        count = len(log_files)
-        log_filename = f"translation_run_{date_str}_{count}.log" if count > 0 else f"translation_run_{date_str}.log"
+        timestamp = datetime.datetime.now().strftime("%Y-%m-%d_%H%M%S_%f")
+        log_filename = f"translation_run_{timestamp}.log"
         log_path = os.path.join(self.logging_path, log_filename)
 
-        logging.basicConfig(
-            level=logging.INFO,
-            format="%(asctime)s - %(levelname)s - %(message)s",
-            handlers=[
-                logging.FileHandler(log_path),
+        # Like basicConfig, leave an already configured root logger alone.
+        if not logging.getLogger().handlers:
+            log_queue = queue.SimpleQueue()
+            listener = logging.handlers.QueueListener(
+                log_queue,
+                logging.FileHandler(log_path, mode="a", delay=True),
                 logging.StreamHandler()
-            ]
-        )
+            )
+            listener.start()
+            # Flush queued records when the process exits.
+            atexit.register(listener.stop)
+            logging.basicConfig(
+                level=logging.INFO,
+                format="%(asctime)s - %(levelname)s - %(message)s",
+                handlers=[logging.handlers.QueueHandler(log_queue)]
+            )
         self.logger = logging.getLogger(__name__)
 
     def create_run_directory(self, target_language: str, output_dir: str, output_dir_name: str = None) -> str:
@@ -49,53 +283,153 @@ class TranslationMaster:
         """
         Path(output_dir).mkdir(parents=True, exist_ok=True)
         run_name = output_dir_name if output_dir_name else target_language
-        existing_runs = [
-            d for d in os.listdir(output_dir)
-            if d.startswith(f"run_{run_name}_") and os.path.isdir(os.path.join(output_dir, d))
-        ]
-        run_count = len(existing_runs) + 1
+        prefix = f"run_{run_name}_"
+        with os.scandir(output_dir) as entries:
+            run_count = sum(1 for entry in entries if entry.name.startswith(prefix) and entry.is_dir()) + 1
         run_dir = os.path.join(output_dir, f"run_{run_name}_{run_count}")
         Path(run_dir).mkdir(parents=True, exist_ok=True)
         return run_dir
 
+    def select_model(self, length: int) -> str:
+        """
+        Returns the model used for content of the given length: the fast model for short content if one is set.
+        """
+        if self.fast_model and length < self.fast_model_threshold_chars:
+            return self.fast_model
+        return self.model_name
+
+    def cache_key(self, content: str, target_language: str, model_name: str) -> str:
+        """
+        Returns the translation cache key for the given content, target language and model.
+        """
+        return hashlib.sha256(f"{model_name}|{target_language}|{content}".encode("utf-8")).hexdigest()
+
+    def lookup_translation(self, content: str, target_language: str):
+        """
+        Returns a cached translation of the content, or None.
+        Short content may have been translated by the main model when it was batched with longer files,
+        so that entry is checked as well after the fast model's.
+        """
+        for model_name in dict.fromkeys((self.select_model(len(content)), self.model_name)):
+            cached = self.get_cached_translation(self.cache_key(content, target_language, model_name))
+            if cached is not None:
+                return cached
+        return None
+
+    def chat_stream(self, model_name: str, system_prompt: str, content: str):
+        """
+        Sends the system prompt and content to the model and yields the raw response text as it is generated.
+        """
+        for chunk in self._client.chat(
+            model=model_name,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": content}
+            ],
+            options={"num_keep": -1},
+            keep_alive=self.keep_alive,
+            stream=True
+        ):
+            yield chunk["message"]["content"]
+
+    def chat(self, model_name: str, system_prompt: str, content: str) -> str:
+        """
+        Sends the system prompt and content to the model and returns the raw response text.
+        """
+        return "".join(self.chat_stream(model_name, system_prompt, content))
+
+    def clean_response(self, content_response: str) -> str:
+        """
+        Cleans up any extraneous tags or formatting added by the model.
+        """
+        return CLEANUP_PATTERN.sub("", content_response).strip()
+
     def prompt_ai(self, content: str, target_language: str) -> str:
         """
-        Constructs a prompt and calls the translation model.
-        The prompt instructs the AI to translate the text while preserving formatting.
+        Translates the content and returns the full translation, see prompt_ai_stream.
         """
-        prompt = f"""
-{content}
-You are a professional translation AI with expertise in technical texts and code files.
-Translate the above content into {target_language}, preserving its exact formatting (line breaks, indentation, and spacing).
-Important:
-- Translate only user-facing strings, labels, messages, and display text.
-- Translate file path or import statements only if they include a language code error.
-- Ensure the translated output remains a valid code file.
-- Do not include additional commentary or explanations.
-"""
-        response = ollama.chat(
-            model=self.model_name,
-            messages=[{"role": "user", "content": prompt}]
+        return "".join(self.prompt_ai_stream(content, target_language))
+
+    def prompt_ai_stream(self, content: str, target_language: str):
+        """
+        Calls the translation model with the content as user message.
+        The system prompt instructs the AI to translate the text while preserving formatting.
+        Yields the cleaned translation in chunks as the model generates it.
+        Identical requests from earlier runs are served from the translation cache.
+        """
+        cached = self.lookup_translation(content, target_language)
+        if cached is not None:
+            yield cached
+            return
+
+        model_name = self.select_model(len(content))
+        cache_key = self.cache_key(content, target_language, model_name)
+
+        system_prompt = SYSTEM_PROMPT.format(target_language=target_language)
+        # The full response is only kept around when it has to go into the cache.
+        parts = [] if self._cache is not None else None
+        for text in clean_stream(self.chat_stream(model_name, system_prompt, content)):
+            if parts is not None:
+                parts.append(text)
+            yield text
+        if parts is not None:
+            self.cache_translation(cache_key, "".join(parts))
+
+    def prompt_ai_batch(self, files: list, target_language: str) -> dict:
+        """
+        Translates several (relative_file_path, content) pairs with a single model call.
+        Returns a dict mapping the index of each file to its translation, and caches each translation.
+        Files the model did not return a well-formed block for are left out.
+        The fast model is used only if every file in the batch is short enough for it.
+        """
+        model_name = self.select_model(max(len(content) for _, content in files))
+        blocks = "\n".join(
+            f"<<<FILE {i}: {rel_path}>>>\n{content}\n<<<END {i}>>>" for i, (rel_path, content) in enumerate(files)
         )
-        content_response = response["message"]["content"]
-        # Clean up any extraneous tags or formatting added by the model.
-        content_response = re.sub(r"<[^>]*>", "", content_response)
-        content_response = re.sub(r"^```", "", content_response)
-        content_response = re.sub(r"<think>.*?</think>", "", content_response, flags=re.DOTALL)
-        return content_response.strip()
+        system_prompt = BATCH_SYSTEM_PROMPT.format(target_language=target_language)
+        # Drop reasoning before parsing so it cannot contain stray file markers.
+        response = THINK_PATTERN.sub("", self.chat(model_name, system_prompt, blocks))
+        translations = {}
+        for match in BATCH_BLOCK_PATTERN.finditer(response):
+            index = int(match.group(1))
+            if index < len(files):
+                translations[index] = self.clean_response(match.group(2))
+                self.cache_translation(self.cache_key(files[index][1], target_language, model_name), translations[index])
+        return translations
 
     def get_all_files(self, input_dir: str):
         """
-        Recursively collects all files from the input directory.
-        Returns a list of tuples: (relative_file_path, absolute_file_path)
+        Recursively yields all files from the input directory.
+        Yields tuples: (relative_file_path, absolute_file_path)
+        """
+        for rel_path, entry in self.scan_files(input_dir):
+            yield rel_path, entry.path
+
+    def scan_files(self, input_dir: str):
+        """
+        Recursively yields all files from the input directory as (relative_file_path, os.DirEntry) tuples.
+        The directory entry carries the file type and, where the platform provides it, the size
+        without extra system calls.
         """
-        file_list = []
-        for root, _, files in os.walk(input_dir):
-            for file in files:
-                abs_path = os.path.join(root, file)
-                rel_path = os.path.relpath(abs_path, input_dir)
-                file_list.append((rel_path, abs_path))
-        return file_list
+        # Every entry path starts with input_dir and a separator, so the relative path is a plain slice
+        # instead of an os.path.relpath call per file.
+        prefix_len = len(os.path.join(input_dir, ""))
+        stack = [input_dir]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = os.scandir(directory)
+            except OSError as e:
+                # Like os.walk, unreadable or missing directories are skipped rather than aborting the run.
+                self.logger.error(f"Failed to read directory {directory}: {str(e)}")
+                continue
+            with entries:
+                for entry in entries:
+                    # Symlinks to directories are not followed, matching os.walk.
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry.path[prefix_len:], entry
 
     def replace_language_in_filename(self, filename: str, target_lang: str) -> str:
         """
@@ -103,33 +437,295 @@ Important:
         If no pattern is found, appends the target language code before the file extension.
         """
         name, ext = os.path.splitext(filename)
-        pattern = re.compile(r"_[a-zA-Z]{2,3}(?=(_|$))")
-        if pattern.search(name):
-            new_name = pattern.sub(f"_{target_lang}", name, count=1) + ext
+        if LANGUAGE_CODE_PATTERN.search(name):
+            new_name = LANGUAGE_CODE_PATTERN.sub(f"_{target_lang}", name, count=1) + ext
         else:
             new_name = f"{name}_{target_lang}{ext}"
         return new_name
 
-    def save_translation(self, run_dir: str, rel_file_path: str, translated_text: str, target_lang: str):
+    def save_translation(self, run_dir: str, rel_file_path: str, translated_text, target_lang: str, newline: str = "\n"):
         """
         Saves the translated text to the run directory while preserving the file’s relative path.
         The file name is modified to include the target language code.
+        translated_text is either a string or an iterable of text chunks, which are written as they arrive.
+        Line breaks are written as newline, so the original line terminator of the input file can be restored.
+        Returns the path of the saved file.
         """
         original_dir, original_file = os.path.split(rel_file_path)
         new_filename = self.replace_language_in_filename(original_file, target_lang)
         output_subdir = os.path.join(run_dir, original_dir)
         Path(output_subdir).mkdir(parents=True, exist_ok=True)
 
-        output_file_path = os.path.join(output_subdir, new_filename)
-        base_name, ext = os.path.splitext(new_filename)
-        counter = 1
-        while os.path.exists(output_file_path):
-            output_file_path = os.path.join(output_subdir, f"{base_name}_{counter}{ext}")
-            counter += 1
+        with self._save_lock:
+            output_file_path, fd = self._create_output_file(output_subdir, new_filename)
+        f = os.fdopen(fd, "w", encoding="utf-8", newline=newline)
 
-        with open(output_file_path, "w", encoding="utf-8") as f:
-            f.write(translated_text)
+        if isinstance(translated_text, str):
+            translated_text = [translated_text]
+        try:
+            with f:
+                for text in translated_text:
+                    f.write(text)
+        except Exception:
+            # Do not leave a partial translation behind.
+            os.remove(output_file_path)
+            with self._save_lock:
+                self._output_names[output_subdir].discard(os.path.basename(output_file_path))
+            raise
         self.logger.info(f"Saved translated file to {output_file_path}")
+        return output_file_path
+
+    def _create_output_file(self, output_subdir: str, filename: str):
+        """
+        Exclusively creates the output file, appending a "_{n}" suffix to the name if it is already taken.
+        Returns the path and an open file descriptor. Must be called with _save_lock held.
+        """
+        names = self._output_names.get(output_subdir)
+        if names is None:
+            with os.scandir(output_subdir) as entries:
+                names = {entry.name for entry in entries}
+            self._output_names[output_subdir] = names
+
+        base_name, ext = os.path.splitext(filename)
+        while True:
+            if filename in names:
+                # Continue after the highest suffix already in use instead of probing each one.
+                prefix = f"{base_name}_"
+                suffixes = [
+                    int(name[len(prefix):len(name) - len(ext)]) for name in names
+                    if name.startswith(prefix) and name.endswith(ext) and name[len(prefix):len(name) - len(ext)].isdecimal()
+                ]
+                filename = f"{base_name}_{max(suffixes, default=0) + 1}{ext}"
+            output_file_path = os.path.join(output_subdir, filename)
+            try:
+                fd = os.open(output_file_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+            except FileExistsError:
+                # Created outside of this process since the directory was scanned.
+                names.add(filename)
+                continue
+            names.add(filename)
+            return output_file_path, fd
+
+    def should_translate(self, rel_path: str, target_language: str) -> bool:
+        """
+        Cheap checks on the file name that run before a file is read.
+        Skips files outside the extension allow-list and files whose name is already tagged with the target language.
+        """
+        filename = os.path.basename(rel_path)
+        if self.translate_extensions is not None and os.path.splitext(filename)[1].lower() not in self.translate_extensions:
+            return False
+        name = os.path.splitext(filename)[0]
+        if LANGUAGE_CODE_PATTERN.search(name) and self.replace_language_in_filename(filename, target_language) == filename:
+            self.logger.info(f"Skipping file already in target language: {rel_path}")
+            return False
+        return True
+
+    def read_file(self, abs_path: str):
+        """
+        Reads a file as UTF-8 text without buffering.
+        Returns a (content, newline) tuple, where content uses "\n" line breaks and newline is the
+        line terminator of the file ("\r\n" or "\n").
+        Returns None for binary files, which are recognised by a NUL byte in the first 4 KiB;
+        the rest of a binary file is never read.
+        """
+        with open(abs_path, "rb", buffering=0) as f:
+            head = f.read(4096)
+            if b"\x00" in head:
+                self.logger.info(f"Skipping binary file: {abs_path}")
+                return None
+            raw = head + f.readall()
+        content = raw.decode("utf-8")
+        # Only files with Windows line endings pay for a second pass over the content.
+        if "\r\n" in content:
+            return content.replace("\r\n", "\n"), "\r\n"
+        return content, "\n"
+
+    def _claim_translation(self, content: str):
+        """
+        Looks up the translation of identical content in the current run.
+        Returns a (future, owner) tuple: the owner must translate and save the content and set the future's result
+        to the (output_file_path, newline) of the saved file, everyone else waits for it.
+        """
+        digest = hashlib.blake2b(content.encode("utf-8")).digest()
+        with self._translations_lock:
+            future = self._translations.get(digest)
+            if future is not None:
+                return future, False
+            future = Future()
+            self._translations[digest] = future
+            return future, True
+
+    def _save_shared_translation(self, future: Future, run_dir: str, rel_path: str, target_language: str, newline: str):
+        """
+        Saves the translation of an identical file translated elsewhere in this run, waiting for it if needed.
+        The translation is streamed from the other file's output, so it is never held in memory.
+        """
+        source_path, source_newline = future.result()
+        self.logger.info(f"Reusing translation of identical file for: {rel_path}")
+
+        def read_lines():
+            with open(source_path, "r", encoding="utf-8", newline="") as f:
+                for line in f:
+                    yield line.replace(source_newline, "\n") if source_newline != "\n" else line
+
+        self.save_translation(run_dir, rel_path, read_lines(), target_language, newline)
+
+    def _translate_one(self, rel_path: str, abs_path: str, run_dir: str, target_language: str):
+        """
+        Reads, translates and saves a single file. Runs inside a worker thread.
+        """
+        result = self.read_file(abs_path)
+        if result is None:
+            return
+        content, newline = result
+        future, owner = self._claim_translation(content)
+        if not owner:
+            self._save_shared_translation(future, run_dir, rel_path, target_language, newline)
+            return
+
+        try:
+            cached = self.lookup_translation(content, target_language)
+            if cached is not None:
+                self.logger.info(f"Using cached translation for: {rel_path}")
+                translation = (cached,)
+            else:
+                self.logger.info(f"Translating file: {rel_path}")
+                translation = self.prompt_ai_stream(content, target_language)
+            output_file_path = self.save_translation(run_dir, rel_path, translation, target_language, newline)
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        future.set_result((output_file_path, newline))
+
+    def _translate_batch(self, batch: list, run_dir: str, target_language: str):
+        """
+        Reads, translates and saves a batch of small files with a single model call. Runs inside a worker thread.
+        Cached files are saved directly and files missing from the model response are translated one by one.
+        Files identical to one translated elsewhere in this run are saved once all of the batch's own files are done.
+        """
+        pending, newlines, owned, shared = [], [], [], []
+        try:
+            for rel_path, abs_path in batch:
+                try:
+                    result = self.read_file(abs_path)
+                except (OSError, UnicodeDecodeError) as e:
+                    # Only this file is lost, the rest of the batch is still translated.
+                    self.logger.error(f"Failed to process file {abs_path}: {str(e)}")
+                    continue
+                if result is None:
+                    continue
+                content, newline = result
+                future, owner = self._claim_translation(content)
+                if not owner:
+                    shared.append((future, rel_path, abs_path, newline))
+                    continue
+                owned.append(future)
+                cached = self.lookup_translation(content, target_language)
+                if cached is not None:
+                    self.logger.info(f"Using cached translation for: {rel_path}")
+                    self._save_batch_file(future, run_dir, rel_path, abs_path, cached, target_language, newline)
+                else:
+                    pending.append((rel_path, abs_path, content, future))
+                    newlines.append(newline)
+
+            translations = {}
+            if len(pending) > 1:
+                self.logger.info(f"Translating batch of {len(pending)} files: {', '.join(rel for rel, _, _, _ in pending)}")
+                try:
+                    translations = self.prompt_ai_batch([(rel, content) for rel, _, content, _ in pending], target_language)
+                except Exception as e:
+                    # Fall through with no translations, so every file is retried on its own below.
+                    self.logger.warning(f"Batch request failed, translating its files separately: {str(e)}")
+            elif pending:
+                self.logger.info(f"Translating file: {pending[0][0]}")
+            for i, (rel_path, abs_path, content, future) in enumerate(pending):
+                translated_text = translations.get(i)
+                if translated_text is None:
+                    if len(pending) > 1 and translations:
+                        self.logger.warning(f"No translation for {rel_path} in batch response, translating it separately")
+                    try:
+                        translated_text = self.prompt_ai(content, target_language)
+                    except Exception as e:
+                        future.set_exception(e)
+                        self.logger.error(f"Failed to process file {abs_path}: {str(e)}")
+                        continue
+                self._save_batch_file(future, run_dir, rel_path, abs_path, translated_text, target_language, newlines[i])
+        except BaseException as e:
+            # Do not leave other workers waiting on translations this batch will never produce.
+            for future in owned:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+
+        for future, rel_path, abs_path, newline in shared:
+            try:
+                self._save_shared_translation(future, run_dir, rel_path, target_language, newline)
+            except Exception as e:
+                self.logger.error(f"Failed to process file {abs_path}: {str(e)}")
+
+    def _save_batch_file(self, future: Future, run_dir: str, rel_path: str, abs_path: str, translated_text: str,
+                         target_language: str, newline: str):
+        """
+        Saves one file of a batch and publishes the saved file for identical files,
+        logging a failure instead of aborting the rest of the batch.
+        """
+        try:
+            output_file_path = self.save_translation(run_dir, rel_path, translated_text, target_language, newline)
+        except Exception as e:
+            future.set_exception(e)
+            self.logger.error(f"Failed to process file {abs_path}: {str(e)}")
+            return
+        future.set_result((output_file_path, newline))
+
+    def _translate_per_file(self, executor: ThreadPoolExecutor, files, run_dir: str, target_language: str) -> dict:
+        """
+        Submits one translation job per file.
+        Returns a dict mapping each future to a description of the files it handles.
+        """
+        return {
+            executor.submit(self._translate_one, rel_path, entry.path, run_dir, target_language): entry.path
+            for rel_path, entry in files
+        }
+
+    def _translate_batched(self, executor: ThreadPoolExecutor, files, run_dir: str, target_language: str) -> dict:
+        """
+        Submits small files in batches limited by batch_files and batch_char_budget.
+        Files larger than half of the budget are submitted on their own.
+        Returns a dict mapping each future to a description of the files it handles.
+        """
+        futures = {}
+        batch, batch_chars = [], 0
+        for rel_path, entry in files:
+            # File size in bytes is used as a cheap upper bound for the character count.
+            try:
+                size = entry.stat().st_size
+            except OSError as e:
+                # The file disappeared or its symlink broke since the directory was scanned.
+                self.logger.error(f"Failed to process file {entry.path}: {str(e)}")
+                continue
+            if size > self.batch_char_budget // 2:
+                futures[executor.submit(self._translate_one, rel_path, entry.path, run_dir, target_language)] = entry.path
+                continue
+            if batch and (batch_chars + size > self.batch_char_budget or len(batch) >= self.batch_files):
+                futures[executor.submit(self._translate_batch, batch, run_dir, target_language)] = \
+                    ", ".join(path for _, path in batch)
+                batch, batch_chars = [], 0
+            batch.append((rel_path, entry.path))
+            batch_chars += size
+        if batch:
+            futures[executor.submit(self._translate_batch, batch, run_dir, target_language)] = \
+                ", ".join(path for _, path in batch)
+        return futures
+
+    def _translate_concatenated(self, executor: ThreadPoolExecutor, files, run_dir: str, target_language: str) -> dict:
+        """
+        Submits all files as a single batch, regardless of the batch limits.
+        Returns a dict mapping the future to a description of the files it handles.
+        """
+        batch = [(rel_path, entry.path) for rel_path, entry in files]
+        if not batch:
+            return {}
+        return {executor.submit(self._translate_batch, batch, run_dir, target_language): ", ".join(path for _, path in batch)}
 
     def start_translating(self, input_dir: str, output_dir: str, target_language: str, output_dir_name: str = None):
         """
@@ -139,20 +735,29 @@ Important:
         self.logger.info(f"Starting translation for files in '{input_dir}' to language '{target_language}'")
         run_dir = self.create_run_directory(target_language, output_dir, output_dir_name)
         self.logger.info(f"Output will be saved to: {run_dir}")
-        all_files = self.get_all_files(input_dir)
-        if not all_files:
-            self.logger.warning(f"No files found in input directory: {input_dir}")
-            return
-
-        for rel_path, abs_path in all_files:
-            self.logger.info(f"Translating file: {rel_path}")
-            try:
-                with open(abs_path, "r", encoding="utf-8") as f:
-                    content = f.read()
-                translated_text = self.prompt_ai(content, target_language)
-                self.save_translation(run_dir, rel_path, translated_text, target_language)
-            except Exception as e:
-                self.logger.error(f"Failed to process file {abs_path}: {str(e)}")
+        self._translations = {}
+        files = (
+            (rel_path, entry) for rel_path, entry in self.scan_files(input_dir)
+            if self.should_translate(rel_path, target_language)
+        )
+        submit = {
+            "per_file": self._translate_per_file,
+            "batched": self._translate_batched,
+            "concatenated": self._translate_concatenated,
+        }[self.mode]
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+                futures = submit(executor, files, run_dir, target_language)
+                if not futures:
+                    self.logger.warning(f"No files to translate found in input directory: {input_dir}")
+                    return
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                    except Exception as e:
+                        self.logger.error(f"Failed to process file {futures[future]}: {str(e)}")
+        finally:
+            self._translations = {}
         self.logger.info("Translation complete")
 
 
@@ -180,6 +785,16 @@ def ask_for_input_dir() -> str:
         return input_dir
 
 
+@functools.lru_cache(maxsize=1)
+def get_available_models() -> tuple:
+    """
+    Returns the names of the locally installed models.
+    The result is cached, call get_available_models.cache_clear() to query ollama again.
+    """
+    model_list: ListResponse = ollama.list()
+    return tuple(model["model"] for model in model_list["models"])
+
+
 def pull_model(model_name: str):
     """
     Pulls the specified model using ollama if it is not already installed.
@@ -191,16 +806,15 @@ def pull_model(model_name: str):
     except Exception as e:
         print(f"Failed to pull model '{model_name}': {str(e)}")
         print("Does the model exist? Make sure the model name is correct.")
-        model_list: ListResponse = ollama.list()
-        models = model_list["models"]
-        available_models = [model["model"] for model in models]
-        print(json.dumps(available_models, indent=2))
+        get_available_models.cache_clear()
+        print(json.dumps(get_available_models(), indent=2))
         exit(1)
 
 
 def get_arguments():
     """
     Parses command-line arguments and prompts for missing values.
+    Returns the parsed arguments with defaults filled in for the language, directories, model and logging path.
     """
     parser = argparse.ArgumentParser(
         description="Translation Master: Translate technical text and code files while preserving formatting."
@@ -212,39 +826,51 @@ def get_arguments():
     parser.add_argument("--model", help="The model name to use for translation", type=str, required=False)
     parser.add_argument("--logging_path", help="The directory to save log files", type=str, required=False)
     parser.add_argument("--pull", help="Automatically pull the model if not installed", action="store_true", required=False)
+    parser.add_argument("--max_concurrency", help="Number of files to translate in parallel", type=int, default=1, required=False)
+    parser.add_argument("--no_cache", help="Disable the persistent translation cache", action="store_true", required=False)
+    parser.add_argument("--translate_extensions", help="Only translate files with these extensions, e.g. .py .json .md", nargs="+", required=False)
+    parser.add_argument("--fast_model", help="Optional: smaller model used for short files, e.g. gemma3:1b-it-q4_0", type=str, required=False)
+    parser.add_argument("--fast_model_threshold_chars", help="Files shorter than this many characters use the fast model", type=int, default=500, required=False)
+    parser.add_argument("--keep_alive", help="How long ollama keeps the model loaded between files", type=str, default="30m", required=False)
+    parser.add_argument("--mode", help="How files are grouped into model requests", choices=TRANSLATION_MODES, default="per_file", required=False)
+    parser.add_argument("--batch_files", help="Maximum number of files per batch in batched mode", type=int, default=16, required=False)
+    parser.add_argument("--batch_char_budget", help="Maximum number of characters per batch in batched mode", type=int, default=8000, required=False)
     args = parser.parse_args()
 
-    language = args.language if args.language else ask_for_language()
-    input_dir = args.input_dir if args.input_dir else ask_for_input_dir()
+    args.language = args.language if args.language else ask_for_language()
+    args.input_dir = args.input_dir if args.input_dir else ask_for_input_dir()
     date_str = datetime.datetime.now().strftime("%Y-%m-%d")
-    output_dir = args.output_dir if args.output_dir else os.path.join(os.getcwd(), "output", date_str)
-    output_dir_name = args.output_dir_name if args.output_dir_name else None
-    model = args.model if args.model else "gemma3:1b"
-    logging_path = args.logging_path if args.logging_path else os.path.join(os.getcwd(), "logs")
+    args.output_dir = args.output_dir if args.output_dir else os.path.join(os.getcwd(), "output", date_str)
+    args.model = args.model if args.model else "gemma3:1b"
+    args.logging_path = args.logging_path if args.logging_path else os.path.join(os.getcwd(), "logs")
 
-    return language, input_dir, output_dir, output_dir_name, model, logging_path, args.pull
+    return args
 
 
 if __name__ == "__main__":
-    target_language, input_dir, output_dir, output_dir_name, model, logging_path, auto_pull = get_arguments()
+    args = get_arguments()
 
-    if len(target_language) < 2:
+    if len(args.language) < 2:
         print("Please enter a valid language code or name.")
         exit(1)
 
-    model_list: ListResponse = ollama.list()
-    models = model_list["models"]
-    available_models = [m["model"] for m in models]
+    available_models = get_available_models()
 
-    if model not in available_models:
-        if auto_pull:
-            pull_model(model)
+    for required_model in (args.model, args.fast_model):
+        if required_model is None or required_model in available_models:
+            continue
+        if args.pull:
+            pull_model(required_model)
         else:
-            print(f"Model '{model}' is not installed. Available models:")
+            print(f"Model '{required_model}' is not installed. Available models:")
             print(json.dumps(available_models, indent=2))
-            print(f"Run 'ollama pull {model}' to install new models, or pass the '--pull' flag to automatically install the model.")
+            print(f"Run 'ollama pull {required_model}' to install new models, or pass the '--pull' flag to automatically install the model.")
             exit(1)
 
-    master = TranslationMaster(model_name=model, logging_path=logging_path)
-    master.start_translating(input_dir, output_dir, target_language, output_dir_name)
+    master = TranslationMaster(model_name=args.model, logging_path=args.logging_path, max_concurrency=args.max_concurrency,
+                               use_cache=not args.no_cache, mode=args.mode, batch_files=args.batch_files,
+                               batch_char_budget=args.batch_char_budget, translate_extensions=args.translate_extensions,
+                               keep_alive=args.keep_alive, fast_model=args.fast_model,
+                               fast_model_threshold_chars=args.fast_model_threshold_chars)
+    master.start_translating(args.input_dir, args.output_dir, args.language, args.output_dir_name)
     print("Processing complete. Check the output directory and logs for details.")